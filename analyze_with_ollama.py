@@ -6,22 +6,69 @@ Analyzes transcription files using Ollama and assigns scores.
 
 import os
 import sys
+import re
 import json
+import hashlib
 from pathlib import Path
 import argparse
 import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import requests  # type: ignore
+    from requests.adapters import HTTPAdapter  # type: ignore
 except ImportError:
     print("Warning: requests not available in current environment")
     print("This script is designed to run in the ollama_python.sif container")
     requests = None  # type: ignore
+    HTTPAdapter = None  # type: ignore
 
 # Configuration
 OLLAMA_BASE_URL = "http://localhost:11434"
 MODEL_NAME = "llama3.2:3b"
 SCORE_THRESHOLD = 75
+# Audio extensions matched to VTT files, in order of preference
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.flac', '.ogg')
+# Number of concurrent requests; match the server's OLLAMA_NUM_PARALLEL
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+# Persistent cache of analyses keyed on a hash of model + prompt
+CACHE_FILE = Path.home() / ".cache" / "uwitsc" / "ollama_cache.json"
+# Number of analyzed files between checkpoints of analysis_results.json
+CHECKPOINT_EVERY = 10
+# VTT lines that aren't transcription text: the header, numeric cue identifiers and cue timings
+VTT_SKIP_RE = re.compile(r'WEBVTT|\d+$|.*-->')
+# How long Ollama keeps the model in VRAM after a request (default is 5 minutes)
+KEEP_ALIVE = "1h"
+# Context window (must fit the prompt plus the longest transcription; changing it reloads the model)
+# and the generation budget per scored call
+NUM_CTX = 8192
+NUM_PREDICT = 256
+# Rough characters per token, used to keep batched prompts inside NUM_CTX
+CHARS_PER_TOKEN = 4
+
+def create_session():
+    """Create a pooled HTTP session so every Ollama request reuses the same connection"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=0)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip"})
+    return session
+
+# Shared session, reused across all VTT files in a speaker folder
+SESSION = create_session() if requests is not None else None
+
+def preload_model():
+    """Load the model into memory ahead of the first analysis; an empty prompt only loads it"""
+    try:
+        SESSION.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={"model": MODEL_NAME, "prompt": "", "keep_alive": KEEP_ALIVE, "options": {"num_ctx": NUM_CTX}},
+            timeout=300
+        )
+        print(f"Model {MODEL_NAME} loaded")
+    except Exception as e:
+        print(f"Warning: could not preload model {MODEL_NAME}: {e}")
 
 def wait_for_ollama(max_wait=180):
     """Wait for Ollama server to be ready and model to be loaded"""
@@ -29,10 +76,18 @@ def wait_for_ollama(max_wait=180):
     server_ready = False
     model_ready = False
     
-    for i in range(max_wait):
+    # Poll with exponential backoff (0.1s, 0.2s, 0.4s, ... capped at 5s)
+    start = time.monotonic()
+    deadline = start + max_wait
+    delay = 0.1
+    last_status = None
+    while time.monotonic() < deadline:
+        elapsed = int(time.monotonic() - start)
+        # Print status at most every 15 seconds
+        print_status = last_status is None or elapsed - last_status >= 15
         try:
             # Check if server is responding
-            response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
+            response = SESSION.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
             if response.status_code == 200:
                 if not server_ready:
                     print("Ollama server is ready!")
@@ -45,125 +100,276 @@ def wait_for_ollama(max_wait=180):
                     if not model_ready:
                         print(f"Model {MODEL_NAME} is available!")
                         model_ready = True
+                        preload_model()
                         return True
                 else:
-                    if i % 15 == 0:  # Print status every 15 seconds
-                        print(f"Waiting for model {MODEL_NAME} to be available... ({i}s elapsed)")
+                    if print_status:
+                        print(f"Waiting for model {MODEL_NAME} to be available... ({elapsed}s elapsed)")
                         print(f"Available models: {model_names}")
+                        last_status = elapsed
         except Exception as e:
-            if i % 10 == 0:  # Print status every 10 seconds
-                print(f"Still waiting for Ollama server... ({i}s elapsed)")
-        time.sleep(1)
+            if print_status:
+                print(f"Still waiting for Ollama server... ({elapsed}s elapsed)")
+                last_status = elapsed
+        time.sleep(max(0, min(delay, deadline - time.monotonic())))
+        delay = min(delay * 2, 5.0)
     
     print(f"Warning: Ollama server or model not ready after {max_wait} seconds, proceeding anyway...")
     return False
 
-def analyze_transcription_file(vtt_file, audio_file_name):
-    """Analyze a single transcription file using Ollama"""
+def load_cache(cache_file=CACHE_FILE):
+    """Load the analysis cache from disk, returning an empty cache if it is missing or unreadable"""
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_cache(cache, cache_file=CACHE_FILE):
+    """Atomically write the analysis cache to disk, merged with whatever is there now.
+    Jobs for other speaker folders share the file, so their new entries must not be dropped."""
+    try:
+        cache_file = Path(cache_file)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        merged = load_cache(cache_file)
+        merged.update(cache)
+        # mkstemp gives a name unique across nodes sharing the home directory
+        fd, tmp_file = tempfile.mkstemp(prefix=f'{cache_file.name}.', suffix='.tmp', dir=cache_file.parent)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp_file, cache_file)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+    except OSError as e:
+        print(f"Warning: could not save analysis cache to {cache_file}: {e}")
+
+SCORING_CRITERIA = """Criteria (points):
+- NetID obtained within 120 seconds (10)
+- Issue resolved (15)
+- Quality of instructions (15)
+- Zoom used for verification (5): full points if the agent mentions "Zoom" (case-insensitive) anywhere
+- Confidential information kept private until verification (7)
+- Overall technical support quality (48)
+
+Rules: read the entire transcription; be fair; score what the agent accomplished; don't deduct for minor issues or things that could have been done differently."""
+
+SCORING_GUIDANCE = "If the agent obtained the NetID, resolved the issue, gave instructions, used Zoom and kept information confidential, score 95-100. Deduct only for significant failures."
+
+def extract_transcription_text(vtt_content):
+    """Extract the spoken text from VTT content in a single pass"""
+    return ' '.join(
+        line for line in (raw.strip() for raw in vtt_content.splitlines())
+        if line and not VTT_SKIP_RE.match(line)
+    )
+
+def build_prompt(transcription_text):
+    """Build the scoring prompt for a single transcription; instructions come first so they form a shared prefix"""
+    return f"""Score this customer service call transcription from 0-100.
+
+{SCORING_CRITERIA}
+{SCORING_GUIDANCE}
+
+Respond with JSON: {{"score": <integer 0-100>, "reasoning": "<why, including what you found about Zoom>"}}
+
+Transcription:
+{transcription_text}"""
+
+def build_batch_prompt(transcription_texts):
+    """Build one scoring prompt covering several transcriptions, numbered from 1"""
+    calls = "\n\n".join(f"--- CALL {i} ---\n{text}" for i, text in enumerate(transcription_texts, 1))
+    return f"""Score each of these {len(transcription_texts)} customer service call transcriptions independently from 0-100.
+
+{SCORING_CRITERIA}
+{SCORING_GUIDANCE}
+
+Respond with JSON: {{"results": [{{"id": <call number>, "score": <integer 0-100>, "reasoning": "<why, including what you found about Zoom>"}}, ...]}} with one entry per call, in order.
+
+{calls}"""
+
+def estimate_tokens(text):
+    """Roughly estimate how many tokens text takes up"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def split_by_context(transcription_texts):
+    """Group transcriptions, in order, so each group's batch prompt plus its replies fits in NUM_CTX.
+    Returns lists of indices; a transcription too long to share a prompt gets a group of its own."""
+    overhead = estimate_tokens(build_batch_prompt([]))
+    groups = []
+    group = []
+    used = overhead
+    for i, text in enumerate(transcription_texts):
+        cost = estimate_tokens(f"--- CALL {len(group) + 1} ---\n{text}\n\n") + NUM_PREDICT
+        if group and used + cost > NUM_CTX:
+            groups.append(group)
+            group = []
+            used = overhead
+        group.append(i)
+        used += cost
+    if group:
+        groups.append(group)
+    return groups
+
+def prompt_cache_key(prompt):
+    """Cache key for a prompt; includes the model so switching models doesn't reuse stale scores"""
+    return hashlib.sha256(f"{MODEL_NAME}\n{prompt}".encode('utf-8')).hexdigest()
+
+def generate(prompt, num_predict=NUM_PREDICT):
+    """Send a prompt to the Ollama generate endpoint in JSON mode and return the HTTP response"""
+    return SESSION.post(
+        f"{OLLAMA_BASE_URL}/api/generate",
+        json={
+            "model": MODEL_NAME,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": KEEP_ALIVE,
+            "format": "json",
+            "options": {
+                "temperature": 0.1,
+                "top_p": 0.9,
+                "num_ctx": NUM_CTX,
+                "num_predict": num_predict
+            }
+        },
+        timeout=300
+    )
+
+def analyze_transcription_file(vtt_file, audio_file_name, cache=None):
+    """Analyze a single transcription file using Ollama, consulting the analysis cache first.
+    Returns (score, reasoning, vtt_content) so callers don't need to re-read the file."""
+    vtt_content = ""
     try:
         # Read VTT file and extract text
         with open(vtt_file, 'r', encoding='utf-8') as f:
             vtt_content = f.read()
         
         # Parse VTT content to extract plain text
-        lines = vtt_content.split('\n')
-        transcription_lines = []
-        for line in lines:
-            if '-->' not in line and line.strip() and not line.startswith('WEBVTT'):
-                transcription_lines.append(line.strip())
-        
-        transcription_text = ' '.join(transcription_lines)
+        transcription_text = extract_transcription_text(vtt_content)
         
         if not transcription_text.strip():
             print(f"No transcription text found in {vtt_file}")
             return None
         
         # Prepare the prompt
-        prompt = f"""Analyze this customer service call transcription and provide a score from 0-100 based on the following criteria:
-
-1. NetID obtained within 120 seconds (10 points)
-2. Issue resolution (15 points) 
-3. Quality of instructions provided (15 points)
-4. Use of Zoom for verification (5 points) - Give full points if agent mentions Zoom verification at any point during the call
-5. Keeping confidential information confidential until verification (7 points)
-6. Overall technical support quality (48 points)
-
-CRITICAL INSTRUCTIONS:
-- Read the ENTIRE transcription word by word
-- For criterion 4: Look for the exact word "Zoom" (case-insensitive) anywhere in the transcription
-- If you find "Zoom" mentioned by the agent, give the full 5 points for criterion 4
-- Be fair and accurate - if the agent performed well, give them the points they deserve
-- Don't deduct points for minor issues or things that could have been done differently
-- Focus on what the agent actually accomplished, not what they could have done better
-- If the agent successfully completed all required tasks, consider giving them full points
-
-Transcription to analyze:
-{transcription_text}
-
-Please respond in JSON format with 'score' (integer 0-100) and 'reasoning' (string explaining the score and specifically mentioning what you found about Zoom usage).
-
-IMPORTANT: If the agent successfully completed all the main tasks (obtained NetID, resolved issue, provided instructions, used Zoom, kept info confidential), consider giving them a score of 95-100. Only deduct points for significant failures, not minor improvements that could have been made."""
+        prompt = build_prompt(transcription_text)
 
+        # Reuse a previous analysis of the exact same prompt, if any
+        cache_key = prompt_cache_key(prompt)
+        if cache is not None and cache_key in cache:
+            print(f"Using cached analysis for {Path(vtt_file).name}")
+            score, reasoning = cache[cache_key]
+            return score, reasoning, vtt_content
+        
         # Call Ollama API
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json={
-                "model": MODEL_NAME,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,
-                    "top_p": 0.9
-                }
-            },
-            timeout=300
-        )
+        response = generate(prompt)
         
-        if response.status_code == 200:
-            result = response.json()
-            response_text = result.get('response', '')
-            
-            # Parse JSON response
-            try:
-                # Extract JSON from response
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}') + 1
-                if start_idx != -1 and end_idx != 0:
-                    json_str = response_text[start_idx:end_idx]
-                    analysis = json.loads(json_str)
-                    
-                    # Handle nested JSON in reasoning field
-                    if 'reasoning' in analysis and isinstance(analysis['reasoning'], str):
-                        try:
-                            # Try to parse reasoning as JSON if it contains nested JSON
-                            if analysis['reasoning'].startswith('{'):
-                                nested_analysis = json.loads(analysis['reasoning'])
-                                return nested_analysis.get('score', analysis.get('score', 0)), nested_analysis.get('reasoning', analysis.get('reasoning', 'No reasoning provided'))
-                        except:
-                            pass  # Use original analysis if nested parsing fails
-                    
-                    return analysis.get('score', 0), analysis.get('reasoning', 'No reasoning provided')
-                else:
-                    # Fallback parsing
-                    score = 50  # Default score
-                    reasoning = response_text
-                    return score, reasoning
-            except json.JSONDecodeError:
-                # Fallback if JSON parsing fails
-                score = 50
-                reasoning = response_text
-                return score, reasoning
-            else:
-                print(f"Ollama API error: {response.status_code}")
-                return 50, "Analysis failed"
+        if response.status_code != 200:
+            print(f"Ollama API error: {response.status_code}")
+            return 50, "Analysis failed", vtt_content
+        
+        # JSON mode guarantees a single JSON object in the response
+        response_text = response.json().get('response', '')
+        try:
+            analysis = json.loads(response_text)
+        except json.JSONDecodeError:
+            # Fallback if JSON parsing fails
+            return 50, response_text, vtt_content
+        
+        score, reasoning = analysis.get('score', 0), analysis.get('reasoning', 'No reasoning provided')
+        if cache is not None:
+            cache[cache_key] = [score, reasoning]
+        return score, reasoning, vtt_content
             
     except Exception as e:
         print(f"Error analyzing {vtt_file}: {e}")
-        return 50, "Analysis error"
+        return 50, "Analysis error", vtt_content
+
+def parse_batch_response(response_text, count):
+    """Parse a batched response into (score, reasoning) pairs ordered by call number.
+    Raises ValueError if the response doesn't contain exactly one result per call."""
+    analysis = json.loads(response_text)
+    entries = analysis.get('results', []) if isinstance(analysis, dict) else []
+    
+    by_id = {}
+    for entry in entries:
+        if isinstance(entry, dict) and 'id' in entry:
+            by_id[int(entry['id'])] = (entry.get('score', 0), entry.get('reasoning', 'No reasoning provided'))
+    
+    if set(by_id) != set(range(1, count + 1)):
+        raise ValueError(f"expected results for calls 1-{count}, got {sorted(by_id)}")
+    return [by_id[i] for i in range(1, count + 1)]
+
+def analyze_batch(vtt_files, audio_file_names, cache=None):
+    """Analyze several transcription files with a single Ollama request.
+    Returns one analyze_transcription_file() result per file, falling back to
+    one request per file if the batched response can't be parsed."""
+    if len(vtt_files) == 1:
+        return [analyze_transcription_file(vtt_files[0], audio_file_names[0], cache)]
+    
+    results = [None] * len(vtt_files)
+    pending = []  # (index, vtt_content, transcription_text)
+    for i, vtt_file in enumerate(vtt_files):
+        try:
+            with open(vtt_file, 'r', encoding='utf-8') as f:
+                vtt_content = f.read()
+        except OSError as e:
+            print(f"Error analyzing {vtt_file}: {e}")
+            results[i] = (50, "Analysis error", "")
+            continue
+        
+        transcription_text = extract_transcription_text(vtt_content)
+        if not transcription_text.strip():
+            print(f"No transcription text found in {vtt_file}")
+            continue
+        
+        # A score from a single-file request is reused; batched scores are cached under their own keys below
+        cache_key = prompt_cache_key(build_prompt(transcription_text))
+        if cache is not None and cache_key in cache:
+            print(f"Using cached analysis for {Path(vtt_file).name}")
+            score, reasoning = cache[cache_key]
+            results[i] = (score, reasoning, vtt_content)
+        else:
+            pending.append((i, vtt_content, transcription_text))
+    
+    # Split the uncached calls so no prompt overflows the context window and loses its instructions
+    for group in split_by_context([text for _, _, text in pending]):
+        group_pending = [pending[j] for j in group]
+        if len(group_pending) == 1:
+            i = group_pending[0][0]
+            results[i] = analyze_transcription_file(vtt_files[i], audio_file_names[i], cache)
+            continue
+        batch_prompt = build_batch_prompt([text for _, _, text in group_pending])
+        # Batched scores are keyed on the batched prompt plus the call number, never the single-file key
+        batch_key = prompt_cache_key(batch_prompt)
+        batch_keys = [f"{batch_key}:{n}" for n in range(1, len(group_pending) + 1)]
+        if cache is not None and all(key in cache for key in batch_keys):
+            print(f"Using cached batched analysis for {len(group_pending)} calls")
+            for (i, vtt_content, _), key in zip(group_pending, batch_keys):
+                score, reasoning = cache[key]
+                results[i] = (score, reasoning, vtt_content)
+            continue
+        try:
+            response = generate(batch_prompt, NUM_PREDICT * len(group_pending))
+            response.raise_for_status()
+            analyses = parse_batch_response(response.json().get('response', ''), len(group_pending))
+        except Exception as e:
+            print(f"Batched analysis failed ({e}), falling back to one request per file")
+            for i, _, _ in group_pending:
+                results[i] = analyze_transcription_file(vtt_files[i], audio_file_names[i], cache)
+        else:
+            for (i, vtt_content, _), key, (score, reasoning) in zip(group_pending, batch_keys, analyses):
+                if cache is not None:
+                    cache[key] = [score, reasoning]
+                results[i] = (score, reasoning, vtt_content)
+    
+    return results
 
-def analyze_speaker_folder(speaker_folder, threshold=75):
+def analyze_speaker_folder(speaker_folder, threshold=75, workers=None, use_cache=True, batch_size=1):
     """Analyze all transcription files in a speaker folder"""
     speaker_path = Path(speaker_folder)
+    if workers is None:
+        workers = OLLAMA_NUM_PARALLEL
     
     if not speaker_path.exists():
         print(f"Error: Speaker folder '{speaker_folder}' does not exist")
@@ -181,43 +387,74 @@ def analyze_speaker_folder(speaker_folder, threshold=75):
     # Wait for Ollama to be ready
     wait_for_ollama()
     
-    # Analyze each VTT file
-    results = {}
-    for vtt_file in vtt_files:
-        print(f"Analyzing: {vtt_file.name}")
-        
-        # Find corresponding audio file
-        audio_file = vtt_file.with_suffix('.wav')
-        if not audio_file.exists():
-            # Try other extensions
-            for ext in ['.mp3', '.m4a', '.flac', '.ogg']:
-                audio_file = vtt_file.with_suffix(ext)
-                if audio_file.exists():
-                    break
-        
-        audio_file_name = audio_file.name if audio_file.exists() else vtt_file.stem
-        
-        # Analyze the transcription
-        analysis_result = analyze_transcription_file(vtt_file, audio_file_name)
-        
-        if analysis_result:
-            score, reasoning = analysis_result
-            results[vtt_file.name] = {
-                'audio_file': audio_file_name,
-                'transcription_file': vtt_file.name,
-                'score': score,
-                'reasoning': reasoning,
-                'transcription_preview': vtt_file.read_text(encoding='utf-8')[:200] + "..." if len(vtt_file.read_text(encoding='utf-8')) > 200 else vtt_file.read_text(encoding='utf-8')
-            }
-            print(f"Analysis complete - Score: {score}")
-        else:
-            print(f"Failed to analyze {vtt_file.name}")
+    cache = load_cache() if use_cache else None
+    
+    # Map each audio file stem to its file name with one directory scan, preferring earlier extensions
+    stem_to_audio = {}
+    for path in speaker_path.iterdir():
+        ext = path.suffix.lower()
+        if ext in AUDIO_EXTENSIONS:
+            current = stem_to_audio.get(path.stem)
+            if current is None or AUDIO_EXTENSIONS.index(ext) < AUDIO_EXTENSIONS.index(current.suffix.lower()):
+                stem_to_audio[path.stem] = path
+    
+    # Analyze batches of VTT files concurrently; Ollama batches parallel requests server-side
+    def analyze_vtt_batch(batch):
+        audio_file_names = []
+        for vtt_file in batch:
+            print(f"Analyzing: {vtt_file.name}")
+            
+            # Find corresponding audio file
+            audio_file = stem_to_audio.get(vtt_file.stem)
+            audio_file_names.append(audio_file.name if audio_file else vtt_file.stem)
         
-        # Save results
-        results_file = speaker_path / "analysis_results.json"
+        # Analyze the transcriptions
+        return zip(batch, audio_file_names, analyze_batch(batch, audio_file_names, cache))
+    
+    batch_size = max(1, batch_size)
+    batches = [vtt_files[i:i + batch_size] for i in range(0, len(vtt_files), batch_size)]
+    
+    results = {}
+    results_file = speaker_path / "analysis_results.json"
+    
+    def save_results():
         with open(results_file, 'w') as f:
             json.dump(results, f, indent=2)
     
+    processed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for batch_results in executor.map(analyze_vtt_batch, batches):
+                for vtt_file, audio_file_name, analysis_result in batch_results:
+                    processed += 1
+                    if analysis_result:
+                        score, reasoning, vtt_content = analysis_result
+                        results[vtt_file.name] = {
+                            'audio_file': audio_file_name,
+                            'transcription_file': vtt_file.name,
+                            'score': score,
+                            'reasoning': reasoning,
+                            'transcription_preview': vtt_content[:200] + "..." if len(vtt_content) > 200 else vtt_content
+                        }
+                        print(f"Analysis complete for {vtt_file.name} - Score: {score}")
+                    else:
+                        print(f"Failed to analyze {vtt_file.name}")
+                    
+                    # Checkpoint results periodically rather than after every file
+                    if processed % CHECKPOINT_EVERY == 0:
+                        save_results()
+    except KeyboardInterrupt:
+        print("Interrupted, saving partial results...")
+        save_results()
+        if cache is not None:
+            save_cache(cache)
+        raise
+    
+    # Save results
+    save_results()
+    if cache is not None:
+        save_cache(cache)
+    
     print(f"Saved analysis results to {results_file}")
     return results
 
@@ -232,6 +469,12 @@ def main():
     parser.add_argument("speaker_folder", help="Speaker folder containing VTT files")
     parser.add_argument("--threshold", type=int, default=SCORE_THRESHOLD, help="Score threshold for organization")
     parser.add_argument("--model", default=MODEL_NAME, help="Ollama model to use")
+    parser.add_argument("--workers", type=int, default=OLLAMA_NUM_PARALLEL,
+                       help=f"Number of concurrent Ollama requests (default: {OLLAMA_NUM_PARALLEL})")
+    parser.add_argument("--batch-size", type=int, default=1,
+                       help="Maximum number of transcriptions scored per Ollama request; fewer are sent "
+                            "when their combined length would overflow the context window (default: 1)")
+    parser.add_argument("--no-cache", action="store_true", help=f"Ignore cached analyses in {CACHE_FILE}")
     
     args = parser.parse_args()
     
@@ -239,7 +482,10 @@ def main():
     MODEL_NAME = args.model
     
     # Analyze the speaker folder
-    results = analyze_speaker_folder(args.speaker_folder, args.threshold)
+    try:
+        results = analyze_speaker_folder(args.speaker_folder, args.threshold, args.workers, not args.no_cache, args.batch_size)
+    finally:
+        SESSION.close()
     
     if results:
         print(f"Successfully analyzed {len(results)} transcription files")
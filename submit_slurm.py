@@ -6,10 +6,12 @@ Organizes results based on analysis scores and manages SLURM job submission.
 """
 
 import os
+import re
 import sys
 import subprocess
 import time
 import shutil
+import string
 from pathlib import Path
 import argparse
 import json
@@ -17,7 +19,94 @@ from datetime import datetime
 
 # Configuration
 AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".ogg", ".wmv", ".avi", ".mp4")
+AUDIO_EXT_SET = frozenset(AUDIO_EXTENSIONS)
 SCORE_THRESHOLD = 75
+# Idle GPU count in hyakalloc output, e.g. "│ Idle: │ 2725 │  197 │" (CPUs, then GPUs)
+IDLE_GPUS_RE = re.compile(r'Idle:\s*│\s*\d+\s*│\s*(\d+)')
+
+# SLURM job scripts; "$$" escapes a literal "$" for the shell
+SLURM_HEADER = """#!/bin/bash
+#SBATCH --job-name=${job_name}
+#SBATCH --mail-type=END,FAIL
+#SBATCH --mail-user=$$USER@uw.edu
+#SBATCH --account=uwit
+#SBATCH --partition=${partition}
+#SBATCH --nodes=1
+#SBATCH --ntasks-per-node=1
+#SBATCH --gpus=${gpus}
+#SBATCH --mem=${mem_gb}G
+#SBATCH --time=${time_limit}
+#SBATCH --export=ALL
+#SBATCH --output=${base_dir}/logs/${job_name}_%j.out
+#SBATCH --error=${base_dir}/logs/${job_name}_%j.err
+
+# Load modules
+module load apptainer
+
+"""
+
+WHISPERX_JOB_TEMPLATE = string.Template(SLURM_HEADER + """# Set up environment
+export HF_TOKEN=${hf_token}
+mkdir -p /tmp/$$USER/.cache
+export XDG_CACHE_HOME=/tmp/$$USER/.cache
+
+# Change to base directory first
+cd "${base_dir}"
+
+# Create output directories
+mkdir -p "${speaker_name}/needs_further_attention"
+mkdir -p "${speaker_name}/reviewed"
+
+# Run WhisperX transcription using container
+apptainer run --nv --bind .../dawnmai/whisperx_python.sif python3 .../dawnmai/transcribe_calls.py "${speaker_name}" --format vtt --gpus ${gpus}
+
+# Start Ollama server and run analysis using container
+apptainer run --nv --bind .../dawnmai/ollama_python.sif bash -c "
+pip install requests
+export CUDA_VISIBLE_DEVICES=0
+export OLLAMA_HOST=0.0.0.0:11434
+export OLLAMA_NUM_PARALLEL=4
+echo 'Starting Ollama server...'
+nohup ollama serve > /dev/null 2>&1 &
+sleep 20
+echo 'Pulling model llama3.2:3b...'
+ollama pull llama3.2:3b
+echo 'Model pull completed, waiting for model to be ready...'
+sleep 40
+echo 'Starting analysis...'
+python3 .../dawnmai/analyze_with_ollama.py '${speaker_name}' --threshold ${threshold}
+"
+
+echo "Job completed for ${speaker_name}"
+""")
+
+OLLAMA_JOB_TEMPLATE = string.Template(SLURM_HEADER + """# Start Ollama server and run analysis using container
+cd "${base_dir}"
+apptainer run --nv --bind .../dawnmai/ollama_python.sif bash -c "OLLAMA_NUM_PARALLEL=4 ollama serve & sleep 15 && python3 .../dawnmai/analyze_with_ollama.py '${speaker_folder}' --threshold ${threshold}"
+
+echo "Ollama analysis completed for ${speaker_name}"
+""")
+
+# Per-job-type settings that take precedence over the GPU configuration
+JOB_OVERRIDES = {
+    "whisperx": {"time_limit": "02:00:00"},
+    "ollama": {"partition": "gpu-h200", "gpus": 1, "mem_gb": 16, "time_limit": "01:00:00"},
+}
+
+def find_audio_files(root):
+    """Yield paths of audio files under root, walking the tree with os.scandir"""
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXT_SET and entry.is_file():
+                    yield entry.path
 
 class SpeakerAnalysisOrchestrator:
     def __init__(self, base_dir, hf_token):
@@ -35,8 +124,7 @@ class SpeakerAnalysisOrchestrator:
         for item in self.base_dir.iterdir():
             if item.is_dir() and not item.name.startswith('.'):
                 # Check if folder contains audio files
-                audio_files = [f for f in item.rglob("*") 
-                             if f.is_file() and f.suffix.lower() in AUDIO_EXTENSIONS]
+                audio_files = list(find_audio_files(item))
                 if audio_files:
                     self.speaker_folders.append(item)
                     print(f"  Found speaker folder: {item.name} ({len(audio_files)} audio files)")
@@ -64,18 +152,8 @@ class SpeakerAnalysisOrchestrator:
                 return "gpu-h200", 1, 32
             
             # Parse hyakalloc output to find idle GPUs
-            idle_gpus = 0
-            lines = result.stdout.split('\n')
-            for line in lines:
-                if 'Idle:' in line and '│' in line:
-                    # The format is: "│ Idle: │ 2725 │  197 │"
-                    parts = line.split('│')
-                    if len(parts) >= 4:
-                        try:
-                            idle_gpus = int(parts[3].strip())
-                            break
-                        except ValueError:
-                            continue
+            match = IDLE_GPUS_RE.search(result.stdout)
+            idle_gpus = int(match.group(1)) if match else 0
             
             if idle_gpus == 0:
                 print("No idle GPUs available, using default config")
@@ -121,88 +199,22 @@ class SpeakerAnalysisOrchestrator:
         else:
             partition, gpus_per_job, mem_gb = "gpu-h200", 1, 32
         
-        if job_type == "whisperx":
-            script_content = f"""#!/bin/bash
-#SBATCH --job-name={job_name}
-#SBATCH --mail-type=END,FAIL
-#SBATCH --mail-user=$USER@uw.edu
-#SBATCH --account=uwit
-#SBATCH --partition={partition}
-#SBATCH --nodes=1
-#SBATCH --ntasks-per-node=1
-#SBATCH --gpus={gpus_per_job}
-#SBATCH --mem={mem_gb}G
-#SBATCH --time=02:00:00
-#SBATCH --export=ALL
-#SBATCH --output={self.base_dir}/logs/{job_name}_%j.out
-#SBATCH --error={self.base_dir}/logs/{job_name}_%j.err
-
-# Load modules
-module load apptainer
-
-# Set up environment
-export HF_TOKEN={self.hf_token}
-mkdir -p /tmp/$USER/.cache
-export XDG_CACHE_HOME=/tmp/$USER/.cache
-
-# Change to base directory first
-cd "{self.base_dir}"
-
-# Create output directories
-mkdir -p "{speaker_folder.name}/needs_further_attention"
-mkdir -p "{speaker_folder.name}/reviewed"
-
-# Run WhisperX transcription using container
-apptainer run --nv --bind .../dawnmai/whisperx_python.sif python3 .../dawnmai/transcribe_calls.py "{speaker_folder.name}" --format vtt
-
-# Start Ollama server and run analysis using container
-apptainer run --nv --bind .../dawnmai/ollama_python.sif bash -c "
-pip install requests
-export CUDA_VISIBLE_DEVICES=0
-export OLLAMA_HOST=0.0.0.0:11434
-echo 'Starting Ollama server...'
-nohup ollama serve > /dev/null 2>&1 &
-sleep 20
-echo 'Pulling model llama3.2:3b...'
-ollama pull llama3.2:3b
-echo 'Model pull completed, waiting for model to be ready...'
-sleep 40
-echo 'Starting analysis...'
-python3 .../dawnmai/analyze_with_ollama.py '{speaker_folder.name}' --threshold {SCORE_THRESHOLD}
-"
-
-echo "Job completed for {speaker_folder.name}"
-"""
-        else:  # ollama analysis
-            script_content = f"""#!/bin/bash
-#SBATCH --job-name={job_name}
-#SBATCH --mail-type=END,FAIL
-#SBATCH --mail-user=$USER@uw.edu
-#SBATCH --account=uwit
-#SBATCH --partition=gpu-h200
-#SBATCH --nodes=1
-#SBATCH --ntasks-per-node=1
-#SBATCH --gpus=1
-#SBATCH --mem=16G
-#SBATCH --time=01:00:00
-#SBATCH --export=ALL
-#SBATCH --output={self.base_dir}/logs/{job_name}_%j.out
-#SBATCH --error={self.base_dir}/logs/{job_name}_%j.err
-
-# Load modules
-module load apptainer
-
-# Start Ollama server and run analysis using container
-cd "{self.base_dir}"
-apptainer run --nv --bind .../dawnmai/ollama_python.sif bash -c "ollama serve & sleep 15 && python3 .../dawnmai/analyze_with_ollama.py '{speaker_folder}' --threshold {SCORE_THRESHOLD}"
-
-echo "Ollama analysis completed for {speaker_folder.name}"
-"""
-        
-        with open(script_path, 'w') as f:
-            f.write(script_content)
+        template = WHISPERX_JOB_TEMPLATE if job_type == "whisperx" else OLLAMA_JOB_TEMPLATE
+        params = {
+            "job_name": job_name,
+            "partition": partition,
+            "gpus": gpus_per_job,
+            "mem_gb": mem_gb,
+            "base_dir": self.base_dir,
+            "hf_token": self.hf_token,
+            "speaker_folder": speaker_folder,
+            "speaker_name": speaker_folder.name,
+            "threshold": SCORE_THRESHOLD,
+        }
+        params.update(JOB_OVERRIDES[job_type])
         
-        os.chmod(script_path, 0o755)
+        script_path.write_text(template.substitute(params))
+        script_path.chmod(0o755)
         return script_path
     
     def submit_slurm_job(self, script_path):
@@ -230,23 +242,30 @@ echo "Ollama analysis completed for {speaker_folder.name}"
         netid = os.environ.get('USER', 'unknown')
         
         while True:
+            # Query every job in a single squeue call
             running_jobs = []
-            for job_id in self.job_ids:
-                try:
-                    result = subprocess.run(['squeue', '-j', job_id, '--noheader'], 
-                                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-                    if result.returncode == 0 and result.stdout.strip():
-                        running_jobs.append(job_id)
-                except subprocess.CalledProcessError:
-                    # Job might be finished
-                    pass
+            try:
+                result = subprocess.run(['squeue', '-j', ','.join(self.job_ids), '--noheader', '-o', '%i %T'], 
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+                if result.returncode == 0:
+                    running_jobs = [line.split()[0] for line in result.stdout.splitlines() if line.strip()]
+                else:
+                    # squeue may reject the list once a job has been purged from the controller; query jobs individually
+                    for job_id in self.job_ids:
+                        result = subprocess.run(['squeue', '-j', job_id, '--noheader'], 
+                                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+                        if result.returncode == 0 and result.stdout.strip():
+                            running_jobs.append(job_id)
+            except subprocess.CalledProcessError:
+                # Jobs might be finished
+                pass
             
             if not running_jobs:
                 print("All jobs completed!")
                 break
             
             # Use squeue -u <netid> as confirmation instead of counting jobs
-            print(f"  Checking job status with squeue...")
+            print(f"  {len(running_jobs)} of {len(self.job_ids)} jobs still running, checking job status with squeue...")
             try:
                 result = subprocess.run(['squeue', '-u', netid], 
                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
@@ -257,7 +276,9 @@ echo "Ollama analysis completed for {speaker_folder.name}"
             except subprocess.CalledProcessError as e:
                 print(f"  Error running squeue: {e}")
             
-            time.sleep(300)  # Check every 5 minutes
+            # Poll often while few jobs remain so completion is noticed quickly, less often while many are running
+            delay = min(60, max(10, 10 * len(running_jobs)))
+            time.sleep(delay)
     
     def organize_results(self, speaker_folder):
         """Organize files based on analysis scores"""
@@ -278,6 +299,9 @@ echo "Ollama analysis completed for {speaker_folder.name}"
         needs_attention.mkdir(exist_ok=True)
         reviewed.mkdir(exist_ok=True)
         
+        # Snapshot the folder once instead of probing each candidate file with exists()
+        existing = set(os.listdir(speaker_folder))
+        
         for transcription_file, data in results.items():
             score = data.get('score', 0)
             audio_file = data.get('audio_file', '')
@@ -301,18 +325,20 @@ echo "Ollama analysis completed for {speaker_folder.name}"
             target_dir.mkdir(parents=True, exist_ok=True)
             
             # Move audio file
-            if audio_path.exists():
+            if audio_path.name in existing:
                 shutil.move(str(audio_path), str(target_dir / audio_path.name))
+                existing.discard(audio_path.name)
             
             # Move associated transcription files
             for ext in ['srt', 'vtt', 'txt', 'json']:
                 trans_file = audio_path.with_suffix(f'.{ext}')
-                if trans_file.exists():
+                if trans_file.name in existing:
                     shutil.move(str(trans_file), str(target_dir / trans_file.name))
+                    existing.discard(trans_file.name)
             
             # Move analysis results JSON to the call-specific folder
             analysis_file = target_dir / "analysis_results.json"
-            if results_file.exists() and not analysis_file.exists():
+            if not analysis_file.exists():
                 # Create a call-specific analysis results file
                 call_analysis = {transcription_file: data}
                 with open(analysis_file, 'w') as f:
@@ -321,8 +347,7 @@ echo "Ollama analysis completed for {speaker_folder.name}"
         print(f"  Organized {len(results)} files for {speaker_folder.name}")
         
         # Clean up the main analysis results file after organization
-        if results_file.exists():
-            results_file.unlink()
+        results_file.unlink(missing_ok=True)
         
         # Clean up the SLURM script file
         slurm_file = self.base_dir / f"{speaker_folder.name}_whisperx.slurm"
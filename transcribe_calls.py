@@ -9,9 +9,24 @@ import sys
 import subprocess
 from pathlib import Path
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
-def setup_environment():
+import whisperx_script
+
+# Models loaded by each GPU worker process, see init_gpu_worker()
+_worker_models = None
+
+def setup_environment(legacy_subprocess=False):
     """Setup environment and check dependencies"""
+    if not legacy_subprocess:
+        # WhisperX runs in this process, so it must be importable here
+        if whisperx_script.whisperx is None:
+            print("Error: whisperx is not available. This script must run in the whisperx_python.sif container.")
+            return False
+        return True
+    
     # Check if whisperx_script.py exists in the expected location
     script_path = "...dawnmai/whisperx_script.py"
     if not os.path.exists(script_path):
@@ -19,8 +34,65 @@ def setup_environment():
         return False
     return True
 
-def transcribe_speaker_folder(speaker_folder, output_format="vtt"):
-    """Transcribe all audio files in a speaker folder"""
+def init_gpu_worker(gpu_ids):
+    """Pin this worker process to one GPU and load the models once for all its files"""
+    global _worker_models
+    os.environ["CUDA_VISIBLE_DEVICES"] = gpu_ids.get()
+    _worker_models = whisperx_script.load_models("cuda")
+
+def transcribe_in_worker(audio_file):
+    """Transcribe one file with this worker's models; returns an error message or None"""
+    model, diarize_model = _worker_models
+    try:
+        whisperx_script.transcribe_file(audio_file, model, diarize_model, "cuda")
+        return None
+    except Exception as e:
+        return str(e)
+
+def visible_gpus(gpus):
+    """Return up to gpus device ids from this job's CUDA_VISIBLE_DEVICES, or 0..gpus-1 if it is unset"""
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is None:
+        return [str(gpu_id) for gpu_id in range(gpus)]
+    return [gpu_id.strip() for gpu_id in visible.split(",") if gpu_id.strip()][:gpus]
+
+def transcribe_on_gpus(audio_files, gpus):
+    """Transcribe audio files with one worker process per GPU, longest files first"""
+    # Pin workers to the GPUs SLURM gave this job, not to physical devices 0..gpus-1
+    gpu_list = visible_gpus(gpus)
+    if not gpu_list:
+        print("Error: CUDA_VISIBLE_DEVICES lists no GPUs")
+        return
+    
+    # Spawn so CUDA is initialised fresh in each worker after CUDA_VISIBLE_DEVICES is set
+    ctx = multiprocessing.get_context("spawn")
+    gpu_ids = ctx.Queue()
+    for gpu_id in gpu_list:
+        gpu_ids.put(gpu_id)
+    
+    audio_files = sorted(audio_files, key=lambda f: f.stat().st_size, reverse=True)
+    with ProcessPoolExecutor(max_workers=len(gpu_list), mp_context=ctx,
+                             initializer=init_gpu_worker, initargs=(gpu_ids,)) as executor:
+        futures = {executor.submit(transcribe_in_worker, str(f)): f for f in audio_files}
+        for future in as_completed(futures):
+            audio_file = futures[future]
+            try:
+                error = future.result()
+            except BrokenProcessPool as e:
+                # A worker died or failed to load its models; every file it had not finished is lost
+                error = f"GPU worker pool broke: {e}"
+            if error:
+                print(f"Transcription failed for {audio_file.name}")
+                print(f"Error: {error}")
+            else:
+                print(f"Successfully transcribed {audio_file.name}")
+
+def transcribe_speaker_folder(speaker_folder, output_format="vtt", legacy_subprocess=False, force=False, gpus=1):
+    """Transcribe all audio files in a speaker folder.
+    Models are loaded once and reused for every file unless legacy_subprocess is set,
+    in which case whisperx_script.py is run in a fresh process per file.
+    With gpus > 1 the files are shared between one worker process per GPU.
+    Files that already have a non-empty VTT are skipped unless force is set."""
     speaker_path = Path(speaker_folder)
     
     if not speaker_path.exists():
@@ -39,7 +111,36 @@ def transcribe_speaker_folder(speaker_folder, output_format="vtt"):
     
     print(f"Found {len(audio_files)} audio files in {speaker_folder}")
     
-    # Transcribe each audio file
+    # Skip files transcribed by a previous run
+    if not force:
+        pending = []
+        for audio_file in audio_files:
+            vtt_file = audio_file.with_suffix('.vtt')
+            if vtt_file.exists() and vtt_file.stat().st_size > 0:
+                print(f"Skipping {audio_file.name}: skipped (cached)")
+            else:
+                pending.append(audio_file)
+        audio_files = pending
+    
+    if gpus > 1 and len(audio_files) > 1 and not legacy_subprocess:
+        transcribe_on_gpus(audio_files, min(gpus, len(audio_files)))
+        audio_files = []
+    elif audio_files and not legacy_subprocess:
+        device = "cuda"
+        model, diarize_model = whisperx_script.load_models(device)
+        # Shortest first, so short calls of similar length share a transcription call
+        audio_files = sorted(audio_files, key=lambda f: f.stat().st_size)
+        outcomes = whisperx_script.transcribe_files([str(f) for f in audio_files], model, diarize_model, device)
+        for audio_file, error in outcomes:
+            name = Path(audio_file).name
+            if error:
+                print(f"Transcription failed for {name}")
+                print(f"Error: {error}")
+            else:
+                print(f"Successfully transcribed {name}")
+        audio_files = []
+    
+    # Transcribe each audio file in its own process
     for audio_file in audio_files:
         print(f"Transcribing: {audio_file.name}")
         
@@ -70,13 +171,19 @@ def main():
     parser = argparse.ArgumentParser(description="Transcribe audio files using WhisperX")
     parser.add_argument("speaker_folder", help="Speaker folder containing audio files")
     parser.add_argument("--format", default="vtt", help="Output format (default: vtt)")
+    parser.add_argument("--legacy-subprocess", action="store_true",
+                       help="Run whisperx_script.py in a separate process for each audio file")
+    parser.add_argument("--force", action="store_true",
+                       help="Re-transcribe audio files that already have a VTT file")
+    parser.add_argument("--gpus", type=int, default=1,
+                       help="Number of GPUs to spread audio files across, one worker process each (default: 1)")
     
     args = parser.parse_args()
     
-    if not setup_environment():
+    if not setup_environment(args.legacy_subprocess):
         sys.exit(1)
     
-    success = transcribe_speaker_folder(args.speaker_folder, args.format)
+    success = transcribe_speaker_folder(args.speaker_folder, args.format, args.legacy_subprocess, args.force, args.gpus)
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
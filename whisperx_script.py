@@ -4,23 +4,101 @@ Enhanced WhisperX Transcription Script
 Performs transcription with speaker diarization and agent identification.
 """
 
+import os
+import re
 import sys
+import shlex
+import subprocess
+import tempfile
+import wave
+import traceback
+import argparse
+import functools
 import warnings
+import bisect
+import queue
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import json
 
+# Inference runs on the GPU, so keep CPU thread pools small; must be set before torch is imported
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
 try:
     import whisperx  # type: ignore
+    from whisperx.asr import WhisperModel as WhisperXModel  # type: ignore
 except ImportError:
     print("Warning: whisperx not available in current environment")
     print("This script is designed to run in the whisperx_python.sif container")
-    whisperx = None  # type: ignore
+    whisperx = WhisperXModel = None  # type: ignore
+
+try:
+    from faster_whisper import WhisperModel, BatchedInferencePipeline  # type: ignore
+except ImportError:
+    WhisperModel = BatchedInferencePipeline = None  # type: ignore
+
+try:
+    import ahocorasick  # type: ignore
+except ImportError:
+    ahocorasick = None  # type: ignore
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None  # type: ignore
+
+try:
+    import pandas as pd  # type: ignore
+except ImportError:
+    pd = None  # type: ignore
+
+try:
+    import torch  # type: ignore
+except ImportError:
+    torch = None  # type: ignore
 
 # Suppress warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="pytorch_lightning")
 warnings.filterwarnings("ignore", category=FutureWarning)
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# Transcription settings. Greedy decoding and VAD-cut 30 s chunks let WhisperX batch
+# many chunks per forward pass; the batch size is picked from the GPU's memory
+WHISPER_MODEL = "large-v2"
+CHUNK_SIZE = 30
+ASR_OPTIONS = {"beam_size": 1}
+VAD_OPTIONS = {"vad_onset": 0.500, "vad_offset": 0.363}
+DEFAULT_BATCH_SIZE = 16
+
+# Optional external diarizer run instead of pyannote, e.g. a speakrs/ONNX build. The command
+# must write an RTTM file; {audio} is replaced by a 16 kHz mono WAV and {rttm} by the output path
+DIARIZER_CMD = os.environ.get("DIARIZER_CMD")
+# Seconds to wait for the external diarizer before giving up on it for this file
+DIARIZER_TIMEOUT = 900
+
+# Skip pyannote diarization when keyword rules alone label at least this share of sentences
+KEYWORD_CONFIDENCE_THRESHOLD = 0.9
+
+# Long recordings are cut at their quietest point near every SPLIT_CHUNK_SECONDS and the
+# pieces transcribed concurrently; the CTranslate2 model gets one worker per thread so the
+# pieces really decode in parallel instead of queueing on a single worker
+SAMPLE_RATE = 16000
+SPLIT_CHUNK_SECONDS = 600
+SPLIT_SEARCH_SECONDS = 30
+SPLIT_FRAME_SECONDS = 0.1
+TRANSCRIBE_THREADS = 2
+
+# Short recordings are packed into one transcription call, separated by more silence than a
+# VAD chunk can span so no chunk mixes two files; packs stop growing at PACK_SECONDS
+PACK_MAX_FILE_SECONDS = 300
+PACK_SECONDS = 600
+PACK_GAP_SECONDS = CHUNK_SIZE + 1
+
+# CTranslate2 weight quantization: int8 weights with fp16 activations on GPU, plain int8 on CPU
+GPU_COMPUTE_TYPE = "int8_float16"
+CPU_COMPUTE_TYPE = "int8"
+
 # Agent identification keywords (case-insensitive)
 AGENT_KEYWORDS = [
     "service", "support", "help", "assistance", "technical", "customer",
@@ -34,47 +112,619 @@ AGENT_KEYWORDS = [
     "i'm stopping", "have a good", "rest of your day"
 ]
 
-def main():
-    if whisperx is None:
-        print("Error: whisperx is not available. This script must run in the whisperx_python.sif container.")
-        sys.exit(1)
+# Common agent phrases (case-insensitive)
+AGENT_PHRASES = [
+    "service center", "how can i help", "what is your", 
+    "i can provide", "i need to verify", "are you able",
+    "if you could", "that would be great", "i see you",
+    "i'm going to leave", "can you let me know", "all right",
+    "awesome", "thank you", "i'm stopping", "take your time",
+    "recovery code", "verify your identity", "zoom application",
+    "meeting id number", "driver's license", "passport",
+    "have a good", "rest of your day", "no worries",
+    "i've just left", "did you have any other questions",
+    "vwnet id", "vw it service", "it should prompt you",
+    "i'll need to verify", "take a look at", "id", "zoom and take"
+]
 
-if len(sys.argv) < 2:
-        print("Usage: python whisperx_script.py <audio_file>")
-    sys.exit(1)
+# Words that keep a very short sentence from being attributed to the user
+AGENT_STOPWORDS = ("service", "center", "help", "provide", "verify", "awesome", "thank")
 
-    audio_file = sys.argv[1]
-device = "cuda"
+# Specific user phrases (case-insensitive)
+USER_PHRASES = [
+    "my netid is", "i'm going to my laptop", 
+    "i'll open zoom", "that worked", "no, that's it", "take care"
+]
+
+# Common user responses like "yes", "no", "ok"; a short sentence starting with one is the user's
+SHORT_RESPONSES = (
+    "yes", "no", "ok", "ok?", "yeah", "sure", "right",
+    "i can", "i will", "i have", "i do", "i am", "i'm",
+    "that's right", "exactly", "correct", "true", "false"
+)
+
+# Responses of one or two words that are always the user's
+SINGLE_WORD_RESPONSES = frozenset({"yes", "no", "ok", "ok?", "yeah", "sure", "right", "good", "great", "fine"})
+
+# User repeating agent information (Zoom IDs, names, etc.)
+REPEAT_PATTERNS = [
     
-    # Extract agent name from folder structure
-audio_path = Path(audio_file)
-agent_name = audio_path.parent.name
+]
 
-    print(f"Processing: {audio_file}")
-print(f"Agent name: {agent_name}")
-    print(f"Using device: {device}")
+# Agent questions that typically get user responses
+QUESTION_INDICATORS = [
+    "what is your", "are you able", "can you", "do you have",
+    "would you like", "is that", "did you", "have you"
+]
+
+class KeywordMatcher:
+    """Finds any of a fixed set of keywords in lowercase text with a single scan.
+    Uses an Aho-Corasick automaton when pyahocorasick is installed, otherwise a compiled regex alternation."""
+    
+    def __init__(self, keywords):
+        # Lowercase once here rather than on every comparison
+        self.keywords = list(dict.fromkeys(keyword.lower() for keyword in keywords))
+        self.automaton = None
+        self.pattern = None
+        if not self.keywords:
+            return
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self.automaton.add_word(keyword, keyword)
+            self.automaton.make_automaton()
+        else:
+            # Longest first so overlapping alternatives don't shadow each other
+            self.pattern = re.compile('|'.join(re.escape(keyword) for keyword in sorted(self.keywords, key=len, reverse=True)))
     
+    def search(self, text):
+        """Return a keyword that occurs in text, or None if there is none"""
+        if self.automaton is not None:
+            for _, keyword in self.automaton.iter(text):
+                return keyword
+        elif self.pattern is not None:
+            match = self.pattern.search(text)
+            if match:
+                return match.group(0)
+        return None
+
+class CategoryMatcher:
+    """Reports which of several named keyword lists occur in lowercase text.
+    With pyahocorasick every list shares one automaton, so one scan covers them all;
+    otherwise each list gets its own KeywordMatcher."""
+    
+    def __init__(self, categories):
+        self.automaton = None
+        self.matchers = None
+        if ahocorasick is not None:
+            tags = {}
+            for category, keywords in categories.items():
+                for keyword in keywords:
+                    tags.setdefault(keyword.lower(), set()).add(category)
+            if tags:
+                self.automaton = ahocorasick.Automaton()
+                for keyword, keyword_tags in tags.items():
+                    self.automaton.add_word(keyword, frozenset(keyword_tags))
+                self.automaton.make_automaton()
+        else:
+            self.matchers = {category: KeywordMatcher(keywords) for category, keywords in categories.items()}
+    
+    def categories(self, text):
+        """Return the set of category names with at least one keyword in text"""
+        found = set()
+        if self.automaton is not None:
+            for _, keyword_tags in self.automaton.iter(text):
+                found |= keyword_tags
+        elif self.matchers is not None:
+            for category, matcher in self.matchers.items():
+                if matcher.search(text) is not None:
+                    found.add(category)
+        return found
+
+AGENT_KEYWORD_MATCHER = KeywordMatcher(AGENT_KEYWORDS)
+
+# Every keyword list classify_sentence() consults, scanned together
+SENTENCE_MATCHER = CategoryMatcher({
+    "agent": AGENT_KEYWORDS + AGENT_PHRASES,
+    "stopword": AGENT_STOPWORDS,
+    "user": USER_PHRASES,
+    "repeat": REPEAT_PATTERNS,
+})
+
+# A run of non-terminators plus its optional terminal punctuation
+SENT_RE = re.compile(r'[^.!?]+[.!?]?')
+
+def split_sentences(text):
+    """Split text into stripped, non-empty sentences ending at '.', '!' or '?'.
+    Text made only of punctuation comes back whole as a single sentence."""
+    return [s.strip() for s in SENT_RE.findall(text) if s.strip()] or [text.strip()]
+
+def split_sentences_lower(text, text_lower):
+    """Split text like split_sentences() and pair each sentence with the same slice of text_lower,
+    so the segment is lowercased once instead of sentence by sentence"""
+    if len(text_lower) != len(text):
+        # A few characters change length when lowercased, so the offsets would not line up
+        return [(sentence, sentence.lower()) for sentence in split_sentences(text)]
+    
+    pairs = []
+    for match in SENT_RE.finditer(text):
+        start, end = match.span()
+        sentence = text[start:end].strip()
+        if sentence:
+            pairs.append((sentence, text_lower[start:end].strip()))
+    return pairs or [(text.strip(), text_lower.strip())]
+
+@functools.lru_cache(maxsize=8192)
+def classify_sentence(sentence_lower):
+    """Classify a lowercase sentence as "agent", "user" or "unknown" from its wording alone.
+    User patterns are checked first, then agent keywords and phrases. Cached because short
+    responses like "yes" and "thank you" recur constantly."""
+    stripped = sentence_lower.strip()
+    n = len(stripped)
+    found = SENTENCE_MATCHER.categories(sentence_lower)
+    
+    # Check for user phrases - be very specific to avoid false positives
+    if "user" in found:
+        return "user"
+    
+    # Check if this is a short response that might be answering a question
+    if n < 15 and stripped.startswith(SHORT_RESPONSES):
+        return "user"
+    
+    # Check for user repeating agent information (like Zoom IDs, codes, etc.)
+    if n < 30 and "repeat" in found:
+        return "user"
+    
+    # If it's a very short response and not clearly agent, assume user
+    if n < 10 and "stopword" not in found:
+        return "user"
+    
+    # If it's a single word response, assume user (the set lookup is cheap, so split only on a hit)
+    if stripped in SINGLE_WORD_RESPONSES and len(stripped.split()) <= 2:
+        return "user"
+    
+    # Check for agent keywords and phrases
+    if "agent" in found:
+        return "agent"
+    
+    return "unknown"
+
+def classify_segments(segments):
+    """Split every segment into sentences and classify each one, in place.
+    Stores '_lower', '_sentences' and '_sentence_labels' on each segment and returns
+    (confident, total) sentence counts."""
+    total = 0
+    confident = 0
+    for segment in segments:
+        text = segment.get('text', '').strip()
+        text_lower = segment['_lower'] = text.lower()
+        pairs = split_sentences_lower(text, text_lower) if text else []
+        sentences = [sentence for sentence, _ in pairs]
+        labels = [classify_sentence(sentence_lower) for _, sentence_lower in pairs]
+        segment['_sentences'] = sentences
+        segment['_sentence_labels'] = labels
+        total += len(labels)
+        confident += len(labels) - labels.count("unknown")
+    return confident, total
+
+@functools.lru_cache(maxsize=None)
+def pick_batch_size(device="cuda"):
+    """Pick the largest transcription batch size that comfortably fits in GPU memory"""
+    if torch is None or device != "cuda" or not torch.cuda.is_available():
+        return DEFAULT_BATCH_SIZE
+    total_gb = torch.cuda.get_device_properties(0).total_memory / 1024 ** 3
+    if total_gb >= 40:
+        return 64
+    if total_gb >= 24:
+        return 32
+    return DEFAULT_BATCH_SIZE
+
+def find_split_points(audio):
+    """Return sample offsets of the quietest 0.1 s frame near every SPLIT_CHUNK_SECONDS"""
+    frame = int(SAMPLE_RATE * SPLIT_FRAME_SECONDS)
+    n_frames = len(audio) // frame
+    energy = np.square(audio[:n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+    
+    chunk_frames = int(SPLIT_CHUNK_SECONDS / SPLIT_FRAME_SECONDS)
+    search_frames = int(SPLIT_SEARCH_SECONDS / SPLIT_FRAME_SECONDS)
+    split_points = []
+    target = chunk_frames
+    # Leave at least half a chunk after the last cut
+    while target < n_frames - chunk_frames // 2:
+        low = target - search_frames
+        high = min(target + search_frames, n_frames)
+        quietest = low + int(np.argmin(energy[low:high]))
+        split_points.append(quietest * frame)
+        target = quietest + chunk_frames
+    return split_points
+
+def transcribe_audio(model, audio, device="cuda"):
+    """Transcribe audio, cutting long recordings at silences and transcribing the pieces concurrently"""
+    split_points = find_split_points(audio) if np is not None else []
+    if not split_points:
+        return transcribe_chunk(model, audio, device)
+    
+    language = model.detect_language(audio[:SAMPLE_RATE * CHUNK_SIZE])
+    offsets = [0] + split_points
+    chunks = np.split(audio, split_points)
+    print(f"Transcribing {len(chunks)} chunks of up to ~{SPLIT_CHUNK_SECONDS // 60} minutes...")
+    with ThreadPoolExecutor(max_workers=TRANSCRIBE_THREADS) as executor:
+        results = list(executor.map(lambda chunk: transcribe_chunk(model, chunk, device, language), chunks))
+    
+    # Shift each chunk's timestamps by where the chunk starts in the full recording
+    segments = []
+    for offset, result in zip(offsets, results):
+        offset_seconds = offset / SAMPLE_RATE
+        for segment in result["segments"]:
+            segment["start"] += offset_seconds
+            segment["end"] += offset_seconds
+            segments.append(segment)
+    return {"segments": segments, "language": language}
+
+def transcribe_chunk(model, audio, device="cuda", language=None):
+    """Run batched transcription, halving the batch size whenever the GPU runs out of memory"""
+    batch_size = pick_batch_size(device)
+    while True:
+        try:
+            return model.transcribe(audio, batch_size=batch_size, chunk_size=CHUNK_SIZE, language=language)
+        except RuntimeError as e:
+            if "out of memory" not in str(e).lower() or batch_size <= 1:
+                raise
+            batch_size //= 2
+            print(f"Out of GPU memory, retrying with batch_size={batch_size}")
+            if torch is not None:
+                torch.cuda.empty_cache()
+
+def sentence_spans(sentences, labels, agent_name, default_speaker):
+    """Pair each sentence with its speaker; unclassified sentences take the segment's speaker"""
+    spans = []
+    for sentence, label in zip(sentences, labels):
+        if label == "agent":
+            spans.append((sentence, agent_name))
+        elif label == "user":
+            spans.append((sentence, "user"))
+        else:
+            spans.append((sentence, default_speaker))
+    return spans
+
+def word_sentence_times(spans, words):
+    """Return (start, end) per sentence from aligned word timestamps.
+    Returns None when the words cannot be matched to the sentences one-to-one."""
+    counts = [len(sentence.split()) for sentence, _ in spans]
+    if not words or sum(counts) != len(words):
+        return None
+    
+    times = []
+    position = 0
+    for count in counts:
+        # Words the aligner could not place (e.g. numerals) have no timestamps
+        timed = [word for word in words[position:position + count] if 'start' in word and 'end' in word]
+        position += count
+        if not timed:
+            return None
+        times.append((timed[0]['start'], timed[-1]['end']))
+    return times
+
+def find_agent_speaker(segments):
+    """Return the diarized speaker who first says an agent keyword, or None"""
+    for segment in segments:
+        keyword = AGENT_KEYWORD_MATCHER.search(segment['_lower'])
+        if keyword is not None:
+            speaker = segment.get('speaker', 'SPEAKER_00')
+            print(f"Identified agent speaker: {speaker} (said '{keyword}')")
+            return speaker
+    return None
+
+def label_segments(segments, agent_name, agent_speaker=None):
+    """Set each segment's speaker by majority vote over its classified sentences, in place.
+    Unclassified sentences go to the agent only if the segment's diarized speaker is agent_speaker."""
+    for segment in segments:
+        sentences = segment['_sentences']
+        labels = segment['_sentence_labels']
+        if not sentences:
+            segment['speaker'] = "user"
+            continue
+        
+        diarized_agent = agent_speaker is not None and segment.get('speaker', 'SPEAKER_00') == agent_speaker
+        segment_speakers = []
+        for label in labels:
+            # Assign speaker based on analysis, falling back to the diarized speaker
+            if label == "agent" or (label == "unknown" and diarized_agent):
+                segment_speakers.append(agent_name)
+            else:
+                segment_speakers.append("user")
+        
+        # Use the most common speaker for this segment
+        speaker_counts = Counter(segment_speakers)
+        segment['speaker'] = speaker_counts.most_common(1)[0][0]
+        segment['_sentence_spans'] = sentence_spans(sentences, labels, agent_name, segment['speaker'])
+
+def format_vtt_timestamp(seconds):
+    """Format seconds as an HH:MM:SS.mmm VTT timestamp"""
+    return f"{int(seconds // 3600):02d}:{int((seconds % 3600) // 60):02d}:{seconds % 60:06.3f}"
+
+class ExternalDiarizer:
+    """Diarize by running DIARIZER_CMD and reading back its RTTM output.
+    Called like the pyannote pipeline and returns the same start/end/speaker DataFrame."""
+    
+    def __init__(self, command):
+        self.command = shlex.split(command)
+    
+    def __call__(self, audio, min_speakers=None, max_speakers=None):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            audio_file = os.path.join(tmp_dir, "audio.wav")
+            rttm_file = os.path.join(tmp_dir, "audio.rttm")
+            write_wav(audio_file, audio)
+            
+            # Plain replacement so other braces in the command are left alone
+            cmd = [arg.replace("{audio}", audio_file).replace("{rttm}", rttm_file) for arg in self.command]
+            try:
+                result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                                        timeout=DIARIZER_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                raise RuntimeError(f"diarizer timed out after {DIARIZER_TIMEOUT} seconds")
+            if result.returncode != 0:
+                raise RuntimeError(f"diarizer exited with code {result.returncode}: {result.stderr.strip()}")
+            
+            return read_rttm(rttm_file)
+
+def write_wav(path, audio):
+    """Write float audio in [-1, 1] as a 16-bit mono WAV at SAMPLE_RATE"""
+    samples = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+
+def read_rttm(path):
+    """Read RTTM speaker turns into a DataFrame with start, end and speaker columns"""
+    rows = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            # SPEAKER <file> <channel> <onset> <duration> <NA> <NA> <speaker> ...
+            if len(fields) >= 8 and fields[0] == "SPEAKER":
+                start = float(fields[3])
+                rows.append({"start": start, "end": start + float(fields[4]), "speaker": fields[7]})
+    return pd.DataFrame(rows, columns=["start", "end", "speaker"])
+
+@functools.lru_cache(maxsize=None)
+def load_diarize_model(device="cuda"):
+    """Load the diarization model on first use and keep it; None if it cannot be loaded"""
+    if DIARIZER_CMD:
+        print(f"Using external diarizer: {DIARIZER_CMD}")
+        return ExternalDiarizer(DIARIZER_CMD)
     try:
-    print("Loading WhisperX model...")
-        model = whisperx.load_model("large-v2", device, compute_type="float16")
-        print("Model loaded successfully!")
+        print("Loading diarization model...")
+        diarize_model = whisperx.load_model("pyannote/speaker-diarization", device=device)
+        print("Diarization model loaded successfully!")
+        return diarize_model
+    except Exception as e:
+        print(f"Could not load diarization model: {e}")
+        return None
+
+def configure_torch(device="cuda"):
+    """Enable TF32 matmuls for the PyTorch models (alignment, VAD, diarization).
+    cuDNN autotuning stays off: these models see a new input length on nearly every call,
+    and benchmark mode would re-tune for each one."""
+    if torch is None:
+        return
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.set_float32_matmul_precision("high")
+    if device == "cuda" and torch.cuda.is_available():
+        torch.cuda.set_device(0)
 
+class FasterWhisperTranscriber:
+    """Runs faster-whisper's BatchedInferencePipeline directly, skipping WhisperX's wrapper.
+    transcribe() and detect_language() return the same shapes as the WhisperX model."""
+    
+    def __init__(self, model_name, device="cuda", compute_type=GPU_COMPUTE_TYPE):
+        # One CTranslate2 worker per transcription thread, so concurrent pieces decode in parallel
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type,
+                                  num_workers=TRANSCRIBE_THREADS)
+        self.pipeline = BatchedInferencePipeline(model=self.model)
+    
+    def transcribe(self, audio, batch_size=DEFAULT_BATCH_SIZE, chunk_size=CHUNK_SIZE, language=None):
+        segments, info = self.pipeline.transcribe(
+            audio, batch_size=batch_size, chunk_length=chunk_size, language=language,
+            beam_size=ASR_OPTIONS["beam_size"], best_of=1,
+            vad_filter=True, without_timestamps=False
+        )
+        # The segments generator does the decoding, so consume it here
+        return {
+            "segments": [{"start": segment.start, "end": segment.end, "text": segment.text} for segment in segments],
+            "language": info.language,
+        }
+    
+    def detect_language(self, audio):
+        language, _, _ = self.model.detect_language(audio)
+        return language
+
+class WhisperXTranscriber:
+    """Runs WhisperX's pipeline with one pipeline object per transcription thread.
+    The pipelines are not thread-safe, so each call borrows one; they share a single
+    CTranslate2 model built with TRANSCRIBE_THREADS workers."""
+    
+    def __init__(self, model_name, device="cuda", compute_type=GPU_COMPUTE_TYPE):
+        model = WhisperXModel(model_name, device=device, compute_type=compute_type, num_workers=TRANSCRIBE_THREADS)
+        self.pipelines = queue.Queue()
+        for _ in range(TRANSCRIBE_THREADS):
+            self.pipelines.put(whisperx.load_model(
+                model_name, device, compute_type=compute_type,
+                asr_options=ASR_OPTIONS, vad_options=VAD_OPTIONS, model=model
+            ))
+    
+    def transcribe(self, audio, **kwargs):
+        pipeline = self.pipelines.get()
+        try:
+            return pipeline.transcribe(audio, **kwargs)
+        finally:
+            self.pipelines.put(pipeline)
+    
+    def detect_language(self, audio):
+        pipeline = self.pipelines.get()
+        try:
+            return pipeline.detect_language(audio)
+        finally:
+            self.pipelines.put(pipeline)
+
+def load_models(device="cuda", preload_diarization=False):
+    """Load the Whisper transcription model once, for reuse across files.
+    The diarization model is loaded lazily by transcribe_file() unless preload_diarization is set."""
+    configure_torch(device)
+    
+    compute_type = GPU_COMPUTE_TYPE if device == "cuda" else CPU_COMPUTE_TYPE
+    if BatchedInferencePipeline is not None:
+        print("Loading faster-whisper model...")
+        model = FasterWhisperTranscriber(WHISPER_MODEL, device, compute_type)
+    else:
+        # Older faster-whisper releases have no batched pipeline; go through WhisperX instead
+        print("Loading WhisperX model...")
+        model = WhisperXTranscriber(WHISPER_MODEL, device, compute_type)
+    print("Model loaded successfully!")
+    
+    diarize_model = load_diarize_model(device) if preload_diarization else None
+    return model, diarize_model
+
+@functools.lru_cache(maxsize=4)
+def load_align_model(language, device="cuda"):
+    """Load the wav2vec2 alignment model for a language once and reuse it"""
+    print(f"Loading alignment model for '{language}'...")
+    return whisperx.load_align_model(language_code=language, device=device)
+
+def transcribe_file(audio_file, model, diarize_model=None, device="cuda"):
+    """Transcribe a single audio file with already-loaded models and save a speaker-labelled VTT next to it"""
+    print(f"Processing: {audio_file}")
+    print(f"Using device: {device}")
+    
     print("Loading audio file...")
     audio = whisperx.load_audio(audio_file)
-        print("Audio loaded successfully!")
+    print("Audio loaded successfully!")
     
     print("Transcribing audio...")
-        result = model.transcribe(audio, batch_size=16)
-        print(f"Transcription completed! Language: {result['language']}")
-        print(f"Number of segments: {len(result['segments'])}")
+    result = transcribe_audio(model, audio, device)
+    return save_labelled_transcript(audio_file, audio, result, diarize_model, device)
+
+def transcribe_packed(model, audios, device="cuda"):
+    """Transcribe several short recordings in one call by laying them end to end with silence between.
+    Returns one WhisperX-shaped result per recording, with timestamps relative to that recording."""
+    gap = np.zeros(SAMPLE_RATE * PACK_GAP_SECONDS, dtype=np.float32)
+    pieces = []
+    offsets = []
+    position = 0
+    for audio in audios:
+        offsets.append(position / SAMPLE_RATE)
+        pieces.extend((audio, gap))
+        position += len(audio) + len(gap)
+    packed = transcribe_audio(model, np.concatenate(pieces), device)
+    
+    # Hand each segment to the recording nearest its start. Boundaries sit mid-gap because VAD
+    # padding can start a recording's first segment slightly inside the silence before it
+    boundaries = [offset - PACK_GAP_SECONDS / 2 for offset in offsets]
+    results = [{"segments": [], "language": packed["language"]} for _ in audios]
+    for segment in packed["segments"]:
+        index = max(bisect.bisect_right(boundaries, segment["start"]) - 1, 0)
+        duration = len(audios[index]) / SAMPLE_RATE
+        start = segment["start"] - offsets[index]
+        end = segment["end"] - offsets[index]
+        # Only segments lying wholly in the silence are dropped
+        if end <= 0 or start >= duration:
+            continue
+        segment["start"] = min(max(start, 0.0), duration)
+        segment["end"] = min(max(end, 0.0), duration)
+        results[index]["segments"].append(segment)
+    return results
+
+def transcribe_files(audio_files, model, diarize_model=None, device="cuda"):
+    """Transcribe many audio files, packing short ones into shared transcription calls.
+    Files should be roughly sorted by length so packs hold recordings of similar duration.
+    Returns (audio_file, error) pairs, where error is None on success."""
+    outcomes = []
+    pack = []
+    
+    def finish(audio_file, audio, result=None):
+        try:
+            if result is None:
+                result = transcribe_audio(model, audio, device)
+            save_labelled_transcript(audio_file, audio, result, diarize_model, device)
+            outcomes.append((audio_file, None))
+        except Exception as e:
+            outcomes.append((audio_file, str(e)))
+    
+    def flush_pack():
+        if not pack:
+            return
+        print(f"Transcribing {len(pack)} short files together...")
+        try:
+            results = transcribe_packed(model, [audio for _, audio in pack], device)
+        except Exception as e:
+            # Fall back to transcribing the files one at a time
+            print(f"Packed transcription failed: {e}")
+            results = [None] * len(pack)
+        for (audio_file, audio), result in zip(pack, results):
+            finish(audio_file, audio, result)
+        pack.clear()
+    
+    for audio_file in audio_files:
+        try:
+            audio = whisperx.load_audio(audio_file)
+        except Exception as e:
+            outcomes.append((audio_file, str(e)))
+            continue
         
-        # Enhanced speaker assignment with sentence-level analysis
-        print("Performing enhanced speaker diarization...")
+        if np is None or len(audio) > SAMPLE_RATE * PACK_MAX_FILE_SECONDS:
+            finish(audio_file, audio)
+            continue
         
-        # First, try to use WhisperX's built-in diarization
+        pack.append((audio_file, audio))
+        if sum(len(packed_audio) for _, packed_audio in pack) >= SAMPLE_RATE * PACK_SECONDS:
+            flush_pack()
+    flush_pack()
+    return outcomes
+
+def save_labelled_transcript(audio_file, audio, result, diarize_model=None, device="cuda"):
+    """Align, diarize and speaker-label a transcription result, then save it as a VTT next to the audio"""
+    # Extract agent name from folder structure
+    audio_path = Path(audio_file)
+    agent_name = audio_path.parent.name
+    
+    print(f"Labelling: {audio_file}")
+    print(f"Agent name: {agent_name}")
+    print(f"Transcription completed! Language: {result['language']}")
+    print(f"Number of segments: {len(result['segments'])}")
+    
+    # Forced alignment gives each word its own timestamps for speaker assignment and VTT timing
+    try:
+        print("Aligning words...")
+        align_model, align_metadata = load_align_model(result["language"], device)
+        aligned = whisperx.align(result["segments"], align_model, align_metadata, audio, device,
+                                 return_char_alignments=False)
+        aligned["language"] = result["language"]
+        result = aligned
+        print("Alignment completed!")
+    except Exception as e:
+        print(f"Alignment failed: {e}")
+        print("Falling back to proportional sentence timing...")
+    
+    # Enhanced speaker assignment with sentence-level analysis
+    print("Performing enhanced speaker diarization...")
+    
+    # Classify every sentence by its wording first; diarization is only needed when too many are ambiguous
+    confident_sentences, total_sentences = classify_segments(result["segments"])
+    keyword_confidence = confident_sentences / total_sentences if total_sentences else 1.0
+    print(f"Keyword rules labelled {keyword_confidence:.0%} of sentences")
+    
+    agent_speaker = None
+    if keyword_confidence >= KEYWORD_CONFIDENCE_THRESHOLD:
+        print("Skipping diarization, keyword-based assignment is confident enough...")
+    else:
         try:
-            print("Loading diarization model...")
-            diarize_model = whisperx.load_model("pyannote/speaker-diarization", device=device)
+            if diarize_model is None:
+                diarize_model = load_diarize_model(device)
+            if diarize_model is None:
+                raise RuntimeError("diarization model is not loaded")
             print("Performing speaker diarization...")
             diarize_segments = diarize_model(audio, min_speakers=1, max_speakers=2)
             print("Speaker detection completed!")
@@ -82,376 +732,125 @@ print(f"Agent name: {agent_name}")
             # Assign speaker labels to words
             print("Assigning speaker labels to words...")
             result = whisperx.assign_word_speakers(diarize_segments, result)
-            
-            # Find the first speaker to say an agent keyword
-            agent_speaker = None
-            for segment in result["segments"]:
-                speaker = segment.get('speaker', 'SPEAKER_00')
-                text = segment.get('text', '').lower()
-            
-                # Check if this speaker said an agent keyword
-                for keyword in AGENT_KEYWORDS:
-                    if keyword.lower() in text:
-                        if agent_speaker is None:
-                            agent_speaker = speaker
-                            print(f"Identified agent speaker: {speaker} (said '{keyword}')")
-                    break
-            
-            # Update speaker labels with sentence-level analysis
-            for segment in result["segments"]:
-                speaker = segment.get('speaker', 'SPEAKER_00')
-                text = segment.get('text', '').strip()
-                
-                if not text:
-                    segment['speaker'] = "user"
-                    continue
-                
-                # Split text into sentences for more granular analysis
-                sentences = []
-                current_sentence = ""
-                for char in text:
-                    current_sentence += char
-                    if char in '.!?':
-                        sentences.append(current_sentence.strip())
-                        current_sentence = ""
-                
-                if current_sentence.strip():
-                    sentences.append(current_sentence.strip())
-                
-                # Analyze each sentence
-                segment_speakers = []
-                for sentence in sentences:
-                    sentence_lower = sentence.lower()
-                    is_agent = False
-                    is_user = False
-                    
-                    # Check for agent keywords
-                    for keyword in AGENT_KEYWORDS:
-                        if keyword.lower() in sentence_lower:
-                            is_agent = True
-                            break
-                    
-                    # Check for user phrases
-                    if not is_agent:
-                        user_phrases = [
-                            "my netid is", "i'm going to my laptop", 
-                            "i'll open zoom", "that worked", "no, that's it", "take care"
-                        ]
-                        for phrase in user_phrases:
-                            if phrase in sentence_lower:
-                                is_user = True
-                                break
-                        
-                        # Check for short responses
-                        if not is_user and len(sentence.strip()) < 15:
-                            short_responses = [
-                                "yes", "no", "ok", "ok?", "yeah", "sure", "right",
-                                "i can", "i will", "i have", "i do", "i am", "i'm",
-                                "that's right", "exactly", "correct", "true", "false"
-                            ]
-                            for response in short_responses:
-                                if sentence_lower.strip() == response or sentence_lower.strip().startswith(response):
-                                    is_user = True
-                                    break
-                        
-                        # Check for user repeating agent information
-                        if not is_user and len(sentence.strip()) < 30:
-                            repeat_patterns = [
-                                
-                            ]
-                            for pattern in repeat_patterns:
-                                if pattern in sentence_lower:
-                                    is_user = True
-                                    break
-                        
-                        # Additional user detection
-                        if not is_user and len(sentence.strip()) < 10:
-                            if not any(agent_word in sentence_lower for agent_word in ["service", "center", "help", "provide", "verify", "awesome", "thank"]):
-                                is_user = True
-                        
-                        # Even more aggressive: single word responses
-                        if not is_user and len(sentence.strip().split()) <= 2:
-                            single_word_responses = ["yes", "no", "ok", "ok?", "yeah", "sure", "right", "good", "great", "fine"]
-                            if sentence_lower.strip() in single_word_responses:
-                                is_user = True
-                    
-                    # Assign speaker based on analysis
-                    if is_agent:
-                        segment_speakers.append(agent_name)
-                    elif is_user:
-                        segment_speakers.append("user")
-                    else:
-                        # Fallback to original diarization logic
-                        if speaker == agent_speaker:
-                            segment_speakers.append(agent_name)
-            else:
-                            segment_speakers.append("user")
-                
-                # Use the most common speaker for this segment
-                from collections import Counter
-                speaker_counts = Counter(segment_speakers)
-                segment['speaker'] = speaker_counts.most_common(1)[0][0]
-                    
+            agent_speaker = find_agent_speaker(result["segments"])
+        
         except Exception as e:
             print(f"Diarization failed: {e}")
             print("Falling back to keyword-based assignment...")
-            
-            # Fallback: Enhanced keyword-based assignment with sentence splitting
-            for segment in result["segments"]:
-                text = segment.get('text', '').strip()
-                if not text:
-                    segment['speaker'] = "user"
-                    continue
-                
-                # Split text into sentences
-                sentences = []
-                current_sentence = ""
-                for char in text:
-                    current_sentence += char
-                    if char in '.!?':
-                        sentences.append(current_sentence.strip())
-                        current_sentence = ""
-                
-                if current_sentence.strip():
-                    sentences.append(current_sentence.strip())
-                
-                # Assign speakers sentence by sentence
-                segment_speakers = []
-                for sentence in sentences:
-                    sentence_lower = sentence.lower()
-                    is_agent = False
-                    is_user = False
-                    
-                    # Check for agent keywords
-                    for keyword in AGENT_KEYWORDS:
-                        if keyword.lower() in sentence_lower:
-                            is_agent = True
-                            break
-                    
-                    # Additional heuristics for agent identification
-                    if not is_agent:
-                        # Check for common agent phrases
-                        agent_phrases = [
-                            "service center", "how can i help", "what is your", 
-                            "i can provide", "i need to verify", "are you able",
-                            "if you could", "that would be great", "i see you",
-                            "i'm going to leave", "can you let me know", "all right",
-                            "awesome", "thank you", "i'm stopping", "take your time",
-                            "recovery code", "verify your identity", "zoom application",
-                            "meeting id number", "driver's license", "passport",
-                            "have a good", "rest of your day", "no worries",
-                            "i've just left", "did you have any other questions",
-                            "vwnet id", "vw it service", "it should prompt you"
-                        ]
-                        for phrase in agent_phrases:
-                            if phrase in sentence_lower:
-                                is_agent = True
-                                break
-                    
-                    # Check for conversational patterns - user responses after agent questions
-                    if not is_agent:
-                        # Look for short responses that are likely from user
-                        if len(sentence.strip()) < 15:
-                            short_responses = [
-                                "yes", "no", "ok", "ok?", "yeah", "sure", "right",
-                                "i can", "i will", "i have", "i do", "i am", "i'm",
-                                "that's right", "exactly", "correct", "true", "false"
-                            ]
-                            for response in short_responses:
-                                if sentence_lower.strip() == response or sentence_lower.strip().startswith(response):
-                                    is_user = True
-                                    break
-                        
-                        # Check for user repeating agent information (like Zoom IDs, codes, etc.)
-                        if not is_user and len(sentence.strip()) < 30:
-                            repeat_patterns = [
-                                
-                            ]
-                            for pattern in repeat_patterns:
-                                if pattern in sentence_lower:
-                                    is_user = True
-                                    break
-                        
-                        # Additional user detection - be more aggressive for short responses
-                        if not is_user and len(sentence.strip()) < 10:
-                            # If it's a very short response and not clearly agent, assume user
-                            if not any(agent_word in sentence_lower for agent_word in ["service", "center", "help", "provide", "verify", "awesome", "thank"]):
-                                is_user = True
-                        
-                        # Even more aggressive: if it's a single word response, assume user
-                        if not is_user and len(sentence.strip().split()) <= 2:
-                            single_word_responses = ["yes", "no", "ok", "ok?", "yeah", "sure", "right", "good", "great", "fine"]
-                            if sentence_lower.strip() in single_word_responses:
-                                is_user = True
-                    
-                    segment_speakers.append(agent_name if is_agent else "user")
-                
-                # Use the most common speaker for this segment
-                from collections import Counter
-                speaker_counts = Counter(segment_speakers)
-                segment['speaker'] = speaker_counts.most_common(1)[0][0]
-        
-        # Save VTT file with enhanced speaker labels
-        output_base = Path(audio_file).with_suffix('')
-        vtt_content = "WEBVTT\n\n"
-        
-        # Process segments and split into more granular chunks for better speaker diarization
+    
+    # Without a diarized agent speaker, anything not clearly agent is the user
+    label_segments(result["segments"], agent_name, agent_speaker)
+    
+    # Save VTT file with enhanced speaker labels
+    output_base = audio_path.with_suffix('')
+    vtt_cues = ["WEBVTT\n\n"]
+    
+    # Process segments and split into more granular chunks for better speaker diarization
     for segment in result["segments"]:
         start_time = segment["start"]
         end_time = segment["end"]
         text = segment["text"].strip()
-            speaker = segment.get("speaker", "user")
-            
-            if not text:
-                continue
-            
-            # Split text into sentences for more granular speaker assignment
-            sentences = []
-            current_sentence = ""
-            for char in text:
-                current_sentence += char
-                if char in '.!?':
-                    sentences.append(current_sentence.strip())
-                    current_sentence = ""
-            
-            if current_sentence.strip():
-                sentences.append(current_sentence.strip())
-            
-            # If we have multiple sentences, try to assign speakers more granularly
-            if len(sentences) > 1:
+        speaker = segment.get("speaker", "user")
+        
+        if not text:
+            continue
+        
+        # Reuse the sentence speakers decided during speaker assignment
+        spans = segment.get('_sentence_spans') or [(text, speaker)]
+        
+        # If we have multiple sentences, try to assign speakers more granularly
+        if len(spans) > 1:
+            times = word_sentence_times(spans, segment.get('words', []))
+            if times is not None:
+                starts, ends = zip(*times)
+            else:
                 # Calculate time per character for more accurate timing
                 total_chars = len(text)
                 time_per_char = (end_time - start_time) / total_chars if total_chars > 0 else 0
                 
-                current_time = start_time
-                for i, sentence in enumerate(sentences):
-                    if not sentence.strip():
-                        continue
-                    
-                    # Determine speaker for this sentence
-                    sentence_speaker = speaker  # Default to segment speaker
-                    sentence_lower = sentence.lower()
-                    
-                    # Check for user phrases - be very specific to avoid false positives
-                    user_phrases = [
-                        "my netid is", "i'm going to my laptop", 
-                        "i'll open zoom", "that worked", "no, that's it", "take care"
-                    ]
-                    is_user = False
-                    for phrase in user_phrases:
-                        if phrase in sentence_lower:
-                            is_user = True
-                            break
-                    
-                    # Check for conversational patterns - user responses after agent questions
-                    if not is_user:
-                        # Look for question patterns in previous sentences to identify user responses
-                        question_indicators = [
-                            "what is your", "are you able", "can you", "do you have",
-                            "would you like", "is that", "did you", "have you"
-                        ]
-                        
-                        # Check if this is a short response that might be answering a question
-                        if len(sentence.strip()) < 15:
-                            short_responses = [
-                                "yes", "no", "ok", "ok?", "yeah", "sure", "right",
-                                "i can", "i will", "i have", "i do", "i am", "i'm",
-                                "that's right", "exactly", "correct", "true", "false"
-                            ]
-                            for response in short_responses:
-                                if sentence_lower.strip() == response or sentence_lower.strip().startswith(response):
-                                    is_user = True
-                                    break
-                        
-                        # Check for user repeating agent information (like Zoom IDs, codes, etc.)
-                        if not is_user and len(sentence.strip()) < 30:
-                            repeat_patterns = [
-                                
-                            ]
-                            for pattern in repeat_patterns:
-                                if pattern in sentence_lower:
-                                    is_user = True
-                                    break
-                        
-                        # Additional user detection - be more aggressive for short responses
-                        if not is_user and len(sentence.strip()) < 10:
-                            # If it's a very short response and not clearly agent, assume user
-                            if not any(agent_word in sentence_lower for agent_word in ["service", "center", "help", "provide", "verify", "awesome", "thank"]):
-                                is_user = True
-                        
-                        # Even more aggressive: if it's a single word response, assume user
-                        if not is_user and len(sentence.strip().split()) <= 2:
-                            single_word_responses = ["yes", "no", "ok", "ok?", "yeah", "sure", "right", "good", "great", "fine"]
-                            if sentence_lower.strip() in single_word_responses:
-                                is_user = True
-                    
-                    # Check for agent keywords and phrases (only if not already identified as user)
-                    is_agent = False
-                    if not is_user:
-                        for keyword in AGENT_KEYWORDS:
-                            if keyword.lower() in sentence_lower:
-                                is_agent = True
-                                break
-                        
-                        # Check for agent phrases
-                        if not is_agent:
-                            agent_phrases = [
-                                "service center", "how can i help", "what is your", 
-                                "i can provide", "i need to verify", "are you able",
-                                "if you could", "that would be great", "i see you",
-                                "i'm going to leave", "can you let me know", "all right",
-                                "awesome", "thank you", "i'm stopping", "take your time",
-                                "verify your identity", "zoom application",
-                                "meeting id number", "driver's license", "passport",
-                                "have a good", "rest of your day", "no worries",
-                                "i've just left", "did you have any other questions",
-                                "vwnet id", "vw it service", "it should prompt you",
-                                "recovery code", "i'll need to verify", "take a look at",
-                                "driver's license", "id", "passport", "zoom and take"
-                            ]
-                            for phrase in agent_phrases:
-                                if phrase in sentence_lower:
-                                    is_agent = True
-                                    break
-                    
-                    # Assign speaker based on analysis
-                    if is_agent:
-                        sentence_speaker = agent_name
-                    elif is_user:
-                        sentence_speaker = "user"
-                    
-                    # Calculate timing for this sentence
-                    sentence_chars = len(sentence)
-                    sentence_duration = sentence_chars * time_per_char
-                    sentence_end_time = min(current_time + sentence_duration, end_time)
-                    
-                    # Convert to VTT format
-                    start_vtt = f"{int(current_time//3600):02d}:{int((current_time%3600)//60):02d}:{current_time%60:06.3f}"
-                    end_vtt = f"{int(sentence_end_time//3600):02d}:{int((sentence_end_time%3600)//60):02d}:{sentence_end_time%60:06.3f}"
-                    
-                    vtt_content += f"{start_vtt} --> {end_vtt}\n[{sentence_speaker}] {sentence}\n\n"
-                    
-                    current_time = sentence_end_time
-            else:
-                # Single sentence - use original timing
-        start_vtt = f"{int(start_time//3600):02d}:{int((start_time%3600)//60):02d}:{start_time%60:06.3f}"
-        end_vtt = f"{int(end_time//3600):02d}:{int((end_time%3600)//60):02d}:{end_time%60:06.3f}"
-        
-        vtt_content += f"{start_vtt} --> {end_vtt}\n[{speaker}] {text}\n\n"
+                # Each sentence ends after its share of characters and the next starts where it ended
+                lengths = np.fromiter((len(sentence) for sentence, _ in spans), dtype=np.int64, count=len(spans))
+                ends = np.minimum(start_time + np.cumsum(lengths) * time_per_char, end_time)
+                starts = np.concatenate(([start_time], ends[:-1]))
+                starts, ends = starts.tolist(), ends.tolist()
+            
+            for (sentence, sentence_speaker), sentence_start, sentence_end in zip(spans, starts, ends):
+                start_vtt = format_vtt_timestamp(sentence_start)
+                end_vtt = format_vtt_timestamp(sentence_end)
+                
+                vtt_cues.append(f"{start_vtt} --> {end_vtt}\n[{sentence_speaker}] {sentence}\n\n")
+        else:
+            # Single sentence - use original timing
+            start_vtt = format_vtt_timestamp(start_time)
+            end_vtt = format_vtt_timestamp(end_time)
+            
+            vtt_cues.append(f"{start_vtt} --> {end_vtt}\n[{speaker}] {text}\n\n")
+    
+    # Write to a temporary file first so an interrupted run never leaves a partial VTT that looks finished
+    vtt_file = f"{output_base}.vtt"
+    tmp_file = f"{vtt_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        f.write("".join(vtt_cues))
+    os.replace(tmp_file, vtt_file)
+    
+    print("VTT file saved with speaker labels!")
+    return vtt_file
 
-    with open(f"{output_base}.vtt", 'w') as f:
-        f.write(vtt_content)
+def reserve_stdout():
+    """Send all further stdout output, including from native libraries, to stderr.
+    Returns a line-buffered file on the original stdout, for protocol replies only."""
+    sys.stdout.flush()
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), 'w', buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return replies
 
-    print("VTT file saved with speaker labels!")
+def serve(model, diarize_model, device="cuda", stream=sys.stdin, replies=sys.stdout):
+    """Transcribe newline-delimited audio paths from a stream with resident models.
+    Writes one "OK <vtt>" or "ERROR <audio>: <message>" line per input path to replies."""
+    for line in stream:
+        audio_file = line.strip()
+        if not audio_file:
+            continue
+        try:
+            vtt_file = transcribe_file(audio_file, model, diarize_model, device)
+            print(f"OK {vtt_file}", file=replies, flush=True)
+        except Exception as e:
+            print(f"ERROR {audio_file}: {e}", file=replies, flush=True)
+
+def main():
+    if whisperx is None:
+        print("Error: whisperx is not available. This script must run in the whisperx_python.sif container.")
+        sys.exit(1)
+    
+    parser = argparse.ArgumentParser(description="Transcribe audio with WhisperX and speaker labels")
+    parser.add_argument("audio_file", nargs="?", help="Audio file to transcribe")
+    parser.add_argument("--serve", action="store_true",
+                       help="Keep models loaded and transcribe audio paths read line by line from stdin")
+    args = parser.parse_args()
+    
+    if not args.serve and not args.audio_file:
+        parser.print_usage()
+        sys.exit(1)
+    
+    device = "cuda"
+    
+    # In serve mode stdout carries only the OK/ERROR replies; progress goes to stderr
+    replies = reserve_stdout() if args.serve else sys.stdout
+    
+    try:
+        model, diarize_model = load_models(device)
+        if args.serve:
+            serve(model, diarize_model, device, replies=replies)
+        else:
+            transcribe_file(args.audio_file, model, diarize_model, device)
         print("Processing completed successfully!")
         sys.exit(0)
-
-except Exception as e:
-    print(f"Error during processing: {e}")
-        import traceback
+    
+    except Exception as e:
+        print(f"Error during processing: {e}")
         traceback.print_exc()
-    print("Exiting with error code 1")
-    sys.exit(1)
+        print("Exiting with error code 1")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()